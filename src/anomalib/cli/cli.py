@@ -267,6 +267,11 @@ class AnomalibCLI:
             help="Set Logger level to INFO",
             action="store_true",
         )
+        sub_parser.add_argument(
+            "--force",
+            help="Run pip install even if all requirements are already satisfied.",
+            action="store_true",
+        )
 
         self.subcommand_parsers["install"] = sub_parser
         action_subcommand.add_subcommand(
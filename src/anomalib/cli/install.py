@@ -4,34 +4,64 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from pkg_resources import Requirement
-from rich.console import Console
-from rich.logging import RichHandler
+from packaging.requirements import Requirement
 
-from anomalib.cli.utils.installation import (
-    get_requirements,
-    get_torch_install_args,
-    parse_requirements,
-)
+if TYPE_CHECKING:
+    from pip._internal.cli.base_command import Command
+    from rich.console import Console
 
 logger = logging.getLogger("pip")
-logger.setLevel(logging.WARNING)  # setLevel: CRITICAL, ERROR, WARNING, INFO, DEBUG, NOTSET
-console = Console()
-handler = RichHandler(
-    console=console,
-    show_level=False,
-    show_path=False,
-)
-logger.addHandler(handler)
 
 
-def anomalib_install(option: str = "full", verbose: bool = False) -> int:
+@lru_cache(maxsize=1)
+def _get_console() -> "Console":
+    """Create the rich console and route the pip logger to it.
+
+    ``rich`` is only imported, and the pip logger only configured, once an installation is actually run.
+    """
+    from rich.console import Console
+    from rich.logging import RichHandler
+
+    logger.setLevel(logging.WARNING)  # setLevel: CRITICAL, ERROR, WARNING, INFO, DEBUG, NOTSET
+    console = Console()
+    handler = RichHandler(
+        console=console,
+        show_level=False,
+        show_path=False,
+    )
+    logger.addHandler(handler)
+    return console
+
+
+@lru_cache(maxsize=1)
+def _pip_install_cmd() -> "Command":
+    """Create the pip install command once and reuse it across calls.
+
+    pip's internals are heavy to import, so the import is deferred until the first installation.
+    """
+    from pip._internal.commands import create_command
+
+    return create_command("install")
+
+
+@lru_cache(maxsize=1)
+def _anomalib_requirements() -> dict[str, list[Requirement]]:
+    """Get the requirements of anomalib, cached for the lifetime of the process."""
+    from anomalib.cli.utils.installation import get_requirements
+
+    return get_requirements("anomalib")
+
+
+def anomalib_install(option: str = "full", verbose: bool = False, force: bool = False) -> int:
     """Install Anomalib requirements.
 
     Args:
         option (str | None): Optional-dependency to install requirements for.
         verbose (bool): Set pip logger level to INFO
+        force (bool): Run pip even if all requirements are already satisfied.
 
     Raises:
         ValueError: When the task is not supported.
@@ -39,9 +69,14 @@ def anomalib_install(option: str = "full", verbose: bool = False) -> int:
     Returns:
         int: Status code of the pip install command.
     """
-    from pip._internal.commands import create_command
+    from anomalib.cli.utils.installation import (
+        get_missing_requirements,
+        get_torch_install_args,
+        parse_requirements,
+    )
 
-    requirements_dict = get_requirements("anomalib")
+    console = _get_console()
+    requirements_dict = _anomalib_requirements()
 
     requirements = []
     if option == "full":
@@ -50,7 +85,7 @@ def anomalib_install(option: str = "full", verbose: bool = False) -> int:
     elif option in requirements_dict:
         requirements.extend(requirements_dict[option])
     elif option is not None:
-        requirements.append(Requirement.parse(option))
+        requirements.append(Requirement(option))
 
     # Parse requirements into torch and other requirements.
     # This is done to parse the correct version of torch (cpu/cuda).
@@ -65,13 +100,20 @@ def anomalib_install(option: str = "full", verbose: bool = False) -> int:
     # Combine torch and other requirements.
     install_args = other_requirements + torch_install_args
 
+    # Skip the pip resolver for requirements that are already satisfied.
+    if not force:
+        install_args = get_missing_requirements(install_args)
+        if not install_args:
+            console.log("All requirements already satisfied.")
+            return 0
+
     # Install requirements.
     with console.status("[bold green]Installing packages...  This may take a few minutes.\n") as status:
         if verbose:
             logger.setLevel(logging.INFO)
             status.stop()
         console.log(f"Installation list: [yellow]{install_args}[/yellow]")
-        status_code = create_command("install").main(install_args)
+        status_code = _pip_install_cmd().main(install_args)
         if status_code == 0:
             console.log(f"Installation Complete: {install_args}")
 
@@ -9,11 +9,13 @@ import json
 import os
 import platform
 import re
-from importlib.metadata import requires
+from importlib.metadata import PackageNotFoundError, requires
+from importlib.metadata import version as get_installed_version
 from pathlib import Path
 from warnings import warn
 
-from pkg_resources import Requirement
+from packaging.requirements import Requirement
+from packaging.version import Version
 
 AVAILABLE_TORCH_VERSIONS = {
     "2.0.0": {"torchvision": "0.15.1", "cuda": ("11.7", "11.8")},
@@ -23,6 +25,10 @@ AVAILABLE_TORCH_VERSIONS = {
     "2.2.0": {"torchvision": "0.16.2", "cuda": ("11.8", "12.1")},
 }
 
+TORCH_SPEC_PRIORITY = {"==": 0, ">=": 1, "~=": 2, "<=": 3}
+
+PIP_OPTIONS_WITH_VALUE = ("--extra-index-url", "--index-url")
+
 
 def get_requirements(module: str = "anomalib") -> dict[str, list[Requirement]]:
     """Get requirements of module from importlib.metadata.
@@ -50,7 +56,7 @@ def get_requirements(module: str = "anomalib") -> dict[str, list[Requirement]]:
         if isinstance(requirement_extra, list) and len(requirement_extra) > 1:
             extra = requirement_extra[-1].split("==")[-1].strip("'\"")
         _requirement_name = requirement_extra[0]
-        _requirement = Requirement.parse(_requirement_name)
+        _requirement = Requirement(_requirement_name)
         if extra in extra_requirement:
             extra_requirement[extra].append(_requirement)
         else:
@@ -58,6 +64,25 @@ def get_requirements(module: str = "anomalib") -> dict[str, list[Requirement]]:
     return extra_requirement
 
 
+def get_specs(requirement: Requirement) -> list[tuple[str, str]]:
+    """Get the version specifiers of a requirement as ``(operator, version)`` pairs.
+
+    ``packaging`` stores the specifiers as an unordered set, so they are sorted
+    to keep the output deterministic.
+
+    Example:
+        >>> get_specs(Requirement("torch>=1.13.0, <=2.0.1"))
+        [('<=', '2.0.1'), ('>=', '1.13.0')]
+
+    Args:
+        requirement (Requirement): Requirement to get the specifiers from.
+
+    Returns:
+        list[tuple[str, str]]: Sorted list of operator and version pairs.
+    """
+    return [(spec.operator, spec.version) for spec in sorted(requirement.specifier, key=str)]
+
+
 def parse_requirements(
     requirements: list[Requirement],
     skip_torch: bool = False,
@@ -73,12 +98,12 @@ def parse_requirements(
 
     Examples:
         >>> requirements = [
-        ...     Requirement.parse("torch==1.13.0"),
-        ...     Requirement.parse("onnx>=1.8.1"),
+        ...     Requirement("torch==1.13.0"),
+        ...     Requirement("onnx>=1.8.1"),
         ... ]
         >>> parse_requirements(requirements=requirements)
-        (Requirement.parse("torch==1.13.0"),
-        Requirement.parse("onnx>=1.8.1"))
+        (Requirement("torch==1.13.0"),
+        Requirement("onnx>=1.8.1"))
 
     Returns:
         tuple[str, list[str], list[str]]: Tuple of torch and other requirements.
@@ -87,9 +112,9 @@ def parse_requirements(
     other_requirements: list[str] = []
 
     for requirement in requirements:
-        if requirement.unsafe_name == "torch":
+        if requirement.name == "torch":
             torch_requirement = str(requirement)
-            if len(requirement.specs) > 1:
+            if len(requirement.specifier) > 1:
                 warn(
                     "requirements.txt contains. Please remove other versions of torch from requirements.",
                     stacklevel=2,
@@ -99,7 +124,7 @@ def parse_requirements(
         # Other torch-related requirements such as `torchvision` are to be excluded.
         # This is because torch-related requirements are already handled in torch_requirement.
         else:
-            # if not requirement.unsafe_name.startswith("torch"):
+            # if not requirement.name.startswith("torch"):
             other_requirements.append(str(requirement))
 
     if not skip_torch and not torch_requirement:
@@ -112,6 +137,59 @@ def parse_requirements(
     return torch_requirement, other_requirements
 
 
+def get_missing_requirements(install_args: list[str]) -> list[str]:
+    """Filter out the requirements that are already satisfied by the installed packages.
+
+    Options such as ``--extra-index-url`` and their values are kept as long as
+    at least one requirement still needs to be installed. Requirements with
+    extras, e.g. ``jsonargparse[signatures]``, are always kept since the
+    dependencies of the extras are not checked.
+
+    Args:
+        install_args (list[str]): Arguments for the pip install command.
+
+    Examples:
+        >>> # Assume that onnx 1.16.0 is installed and openvino is not.
+        >>> get_missing_requirements(["onnx>=1.8.1", "openvino>=2024.0"])
+        ['openvino>=2024.0']
+
+        >>> get_missing_requirements(["onnx>=1.8.1"])
+        []
+
+    Returns:
+        list[str]: Install arguments without the already satisfied requirements.
+            Empty if every requirement is satisfied.
+    """
+    missing_requirements: list[str] = []
+    options: list[str] = []
+
+    arguments = iter(install_args)
+    for argument in arguments:
+        if argument.startswith("-"):
+            options.append(argument)
+            if argument in PIP_OPTIONS_WITH_VALUE:
+                value = next(arguments, None)
+                if value is not None:
+                    options.append(value)
+            continue
+        requirement = Requirement(argument)
+        if requirement.extras:
+            # The dependencies of the extras are not checked, so leave it to pip to resolve them.
+            missing_requirements.append(argument)
+            continue
+        try:
+            installed_version = get_installed_version(requirement.name)
+        except PackageNotFoundError:
+            missing_requirements.append(argument)
+            continue
+        if not requirement.specifier.contains(installed_version, prereleases=True):
+            missing_requirements.append(argument)
+
+    if not missing_requirements:
+        return []
+    return missing_requirements + options
+
+
 def get_cuda_version() -> str | None:
     """Get CUDA version installed on the system.
 
@@ -293,24 +371,25 @@ def add_hardware_suffix_to_torch(
             Defaults to False.
 
     Examples:
-        >>> from pkg_resources import Requirement
+        >>> from packaging.requirements import Requirement
+from packaging.version import Version
         >>> req = "torch>=1.13.0, <=2.0.1"
-        >>> requirement = Requirement.parse(req)
-        >>> requirement.name, requirement.specs
-        ('torch', [('>=', '1.13.0'), ('<=', '2.0.1')])
+        >>> requirement = Requirement(req)
+        >>> requirement.name, get_specs(requirement)
+        ('torch', [('<=', '2.0.1'), ('>=', '1.13.0')])
 
         >>> add_hardware_suffix_to_torch(requirement)
-        'torch>=1.13.0+cu121, <=2.0.1+cu121'
+        'torch<=2.0.1+cu121, >=1.13.0+cu121'
 
         ``with_available_torch_build=True`` will use the latest available PyTorch build.
         >>> req = "torch==2.0.1"
-        >>> requirement = Requirement.parse(req)
+        >>> requirement = Requirement(req)
         >>> add_hardware_suffix_to_torch(requirement, with_available_torch_build=True)
         'torch==2.0.1+cu118'
 
         It is possible to pass the ``hardware_suffix`` manually.
         >>> req = "torch==2.0.1"
-        >>> requirement = Requirement.parse(req)
+        >>> requirement = Requirement(req)
         >>> add_hardware_suffix_to_torch(requirement, hardware_suffix="cu121")
         'torch==2.0.1+cu111'
 
@@ -320,10 +399,10 @@ def add_hardware_suffix_to_torch(
     Returns:
         str: Updated torch package with the right cuda suffix.
     """
-    name = requirement.unsafe_name
+    name = requirement.name
     updated_specs: list[str] = []
 
-    for operator, version in requirement.specs:
+    for operator, version in get_specs(requirement):
         hardware_suffix = hardware_suffix or get_hardware_suffix(with_available_torch_build, version)
         updated_version = version + f"+{hardware_suffix}" if not version.startswith(("2.1", "2.2")) else version
 
@@ -364,7 +443,8 @@ def get_torch_install_args(requirement: str | Requirement) -> list[str]:
         RuntimeError: If the OS is not supported.
 
     Example:
-        >>> from pkg_resources import Requirement
+        >>> from packaging.requirements import Requirement
+from packaging.version import Version
         >>> requriment = "torch>=1.13.0"
         >>> get_torch_install_args(requirement)
         ['--extra-index-url', 'https://download.pytorch.org/whl/cpu',
@@ -374,20 +454,34 @@ def get_torch_install_args(requirement: str | Requirement) -> list[str]:
         list[str]: The install arguments.
     """
     if isinstance(requirement, str):
-        requirement = Requirement.parse(requirement)
+        requirement = Requirement(requirement)
 
-    # NOTE: This does not take into account if the requirement has multiple versions
-    #   such as torch<2.0.1,>=1.13.0
-    if len(requirement.specs) < 1:
+    specs = get_specs(requirement)
+    if len(specs) < 1:
         return [str(requirement)]
-    select_spec_idx = 0
-    for i, spec in enumerate(requirement.specs):
-        if "=" in spec[0]:
-            select_spec_idx = i
-            break
-    operator, version = requirement.specs[select_spec_idx]
-    if version not in AVAILABLE_TORCH_VERSIONS:
-        version = max(AVAILABLE_TORCH_VERSIONS.keys())
+
+    def _priority(spec: tuple[str, str]) -> int:
+        return TORCH_SPEC_PRIORITY.get(spec[0], len(TORCH_SPEC_PRIORITY))
+
+    # Select an available torch build that satisfies the whole specifier, e.g. torch<=2.0.1,>=1.8.1 selects
+    # 2.0.1. A version written in the specifier is preferred (an exact version first, then the lower bound,
+    # then the upper bound). Otherwise the latest available build within the range is pinned.
+    written_versions = sorted(
+        (spec for spec in specs if spec[1] in AVAILABLE_TORCH_VERSIONS and requirement.specifier.contains(spec[1])),
+        key=_priority,
+    )
+    available_versions = [
+        available_version
+        for available_version in AVAILABLE_TORCH_VERSIONS
+        if requirement.specifier.contains(available_version)
+    ]
+    if written_versions:
+        operator, version = written_versions[0]
+    elif available_versions:
+        operator, version = "==", max(available_versions, key=Version)
+    else:
+        operator, _ = min(specs, key=_priority)
+        version = max(AVAILABLE_TORCH_VERSIONS.keys(), key=Version)
         warn(
             f"Torch Version will be selected as {version}.",
             stacklevel=2,
@@ -9,35 +9,39 @@
 # Copyright (C) 2023-2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import functools
 import hashlib
 import logging
 import os
+import queue
+import threading
+import zipfile
 from typing import List, Union
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 import torch
+import torch.nn.functional as F
+import PIL
 from PIL import Image
-from pkg_resources import packaging
-from torchvision.transforms import CenterCrop, Compose, Normalize, Resize, ToTensor
+from packaging import version
+from torch import nn
+from torchvision.io import ImageReadMode, decode_image, decode_jpeg, read_file
+from torchvision.transforms.functional import pil_to_tensor
 from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
 from .model import build_model
 
-try:
-    from torchvision.transforms import InterpolationMode
 
-    BICUBIC = InterpolationMode.BICUBIC
-except ImportError:
-    BICUBIC = Image.BICUBIC
-
-
-if packaging.version.parse(torch.__version__) < packaging.version.parse("1.7.1"):
+if version.parse(torch.__version__) < version.parse("1.7.1"):
     msg = "PyTorch version 1.7.1 or higher is recommended"
     logger.warn(msg)
 
-__all__ = ["available_models", "load"]
+_TORCH_SUPPORTS_MMAP = version.parse(torch.__version__) >= version.parse("2.1")
+
+__all__ = ["available_models", "load", "read_image"]
 
 _MODELS = {
     "RN50": "https://openaipublic.azureedge.net/clip/models/afeb0e10f9e5a86da6080e35cf09123aca3b358a0c3e3b6c78a7b63bc04b6762/RN50.pt",
@@ -52,49 +56,182 @@ _MODELS = {
 }
 
 
+# a single pooled session keeps the connection (and TLS session) to the CDN alive across downloads and retries
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+
+def _sha256():
+    # usedforsecurity=False lets hashlib pick the OpenSSL implementation (with SHA-NI / ARMv8 SHA2 where the CPU
+    # supports it) even on FIPS-restricted builds; the checksum only guards against corrupted downloads.
+    return hashlib.new("sha256", usedforsecurity=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_if_not_openssl() -> None:
+    if type(_sha256()).__module__ != "_hashlib":
+        logger.warning(
+            "hashlib is not backed by OpenSSL; verifying CLIP checkpoints will fall back to a slower SHA-256 "
+            "implementation"
+        )
+
+
+def _hash_file(file_path: str, chunk_size: int = 64 << 20):
+    # A reader thread fills a small bounded queue while this thread hashes, so disk reads overlap with hashing.
+    # hashlib releases the GIL while hashing large buffers, which lets the two threads run concurrently.
+    sha256_hash = _sha256()
+    chunks = queue.Queue(maxsize=2)
+    # set by this thread once it stops consuming, so that the reader never blocks on a full queue forever
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(file):
+        # always end with either the exception or the None sentinel, otherwise the consumer blocks forever
+        end = None
+        try:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                if not _put(chunk):
+                    return
+        except BaseException as exception:
+            end = exception
+        finally:
+            _put(end)
+
+    with open(file_path, "rb", buffering=0) as file:
+        if hasattr(os, "posix_fadvise"):
+            # read-ahead aggressively and start prefetching the whole file so the reader does not stall on the disk
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        reader = threading.Thread(target=_read, args=(file,), name="clip-hash-reader", daemon=True)
+        reader.start()
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                sha256_hash.update(chunk)
+        finally:
+            stop.set()
+            reader.join()
+
+    return sha256_hash
+
+
 def _verify_checksum(file_path: str, url: str) -> bool:
+    _warn_if_not_openssl()
     expected_sha256 = url.split("/")[-2]
-    sha256_hash = hashlib.sha256()
+    file_hash = _hash_file(file_path).hexdigest()
+
+    return file_hash == expected_sha256
 
-    with open(file_path, "rb") as file:
-        for chunk in iter(lambda: file.read(4096), b""):
-            sha256_hash.update(chunk)
 
-    file_hash = sha256_hash.hexdigest()
+def _stat_signature(file_path: str) -> str:
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns} {stat.st_size}"
 
-    return file_hash == expected_sha256
+
+def _is_verified(file_path: str, marker_path: str) -> bool:
+    try:
+        with open(marker_path) as marker:
+            return marker.read().strip() == _stat_signature(file_path)
+    except OSError:
+        return False
+
+
+def _mark_verified(file_path: str, marker_path: str) -> None:
+    with open(marker_path, "w") as marker:
+        marker.write(_stat_signature(file_path))
 
 
 def _download(url: str, root: str):
+    _warn_if_not_openssl()
     os.makedirs(root, exist_ok=True)
-    filename = os.path.basename(urlparse(url).path)
-    download_target = os.path.join(root, filename)
+    expected_sha256 = url.split("/")[-2]
+    # files are addressed by their checksum, so identical weights are shared and only need to be verified once;
+    # the marker file records the stat of the file when it was last verified
+    download_target = os.path.join(root, expected_sha256 + ".pt")
+    partial_target = download_target + ".part"
+    marker_target = os.path.join(root, expected_sha256 + ".ok")
+
+    # move a file cached under its previous name (the basename of the url) to the checksum name
+    legacy_target = os.path.join(root, os.path.basename(urlparse(url).path))
+    if not os.path.exists(download_target) and os.path.isfile(legacy_target):
+        if _verify_checksum(legacy_target, url):
+            os.replace(legacy_target, download_target)
+            _mark_verified(download_target, marker_target)
+            return download_target
+
+        logger.warning("%s exists, but the checksum does not match; removing the file", legacy_target)
+        os.remove(legacy_target)
 
     if os.path.exists(download_target):
         if not os.path.isfile(download_target):
             raise FileExistsError(f"{download_target} exists and is not a regular file")
+        if _is_verified(download_target, marker_target):
+            return download_target
         if _verify_checksum(download_target, url):
+            _mark_verified(download_target, marker_target)
             return download_target
 
         logger.warning("%s exists, but the checksum does not match; re-downloading the file", download_target)
         os.remove(download_target)
 
-    response = requests.get(url, stream=True, timeout=10.0)  # Timeout is for bandit security linter
-    response.raise_for_status()
-
-    total_size = int(response.headers.get("Content-Length", 0))
-
-    with open(download_target, "wb") as file, tqdm(
-        total=total_size, ncols=80, unit="iB", unit_scale=True, unit_divisor=1024
-    ) as loop:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                file.write(chunk)
-                loop.update(len(chunk))
+    # resume an interrupted download; the prefix on disk is hashed before the request is sent, so that the
+    # streaming connection is not left unread while a large partial file is being hashed
+    resume_from, prefix_hash = 0, None
+    if os.path.isfile(partial_target):
+        resume_from = os.path.getsize(partial_target)
+        prefix_hash = _hash_file(partial_target)
+        if prefix_hash.hexdigest() == expected_sha256:  # interrupted after the last write, nothing left to fetch
+            os.replace(partial_target, download_target)
+            _mark_verified(download_target, marker_target)
+            return download_target
 
-    if not _verify_checksum(download_target, url):
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+    response = _SESSION.get(url, stream=True, timeout=10.0, headers=headers)  # Timeout is for bandit security linter
+    if response.status_code == 416:  # the partial file is not a prefix of the remote file; start over
+        response.close()
+        resume_from = 0
+        response = _SESSION.get(url, stream=True, timeout=10.0)
+
+    with response:
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            logger.info("Resuming download of %s from byte %d", download_target, resume_from)
+            sha256_hash = prefix_hash
+            mode = "ab"
+        else:  # the server does not support ranges (or nothing to resume); rewrite the whole file
+            resume_from = 0
+            sha256_hash = _sha256()
+            mode = "wb"
+
+        total_size = resume_from + int(response.headers.get("Content-Length", 0))
+
+        # hash the chunks as they arrive so that verification does not need a second pass over the file
+        with open(partial_target, mode) as file, tqdm(
+            total=total_size, initial=resume_from, ncols=80, unit="iB", unit_scale=True, unit_divisor=1024
+        ) as loop:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                if chunk:
+                    file.write(chunk)
+                    sha256_hash.update(chunk)
+                    loop.update(len(chunk))
+
+    if sha256_hash.hexdigest() != expected_sha256:
+        os.remove(partial_target)
         raise RuntimeError("Model has been downloaded but the checksum does not match")
 
+    os.replace(partial_target, download_target)
+    _mark_verified(download_target, marker_target)
+
     return download_target
 
 
@@ -102,16 +239,120 @@ def _convert_image_to_rgb(image):
     return image.convert("RGB")
 
 
-def _transform(n_px):
-    return Compose(
-        [
-            Resize(n_px, interpolation=BICUBIC),
-            CenterCrop(n_px),
-            _convert_image_to_rgb,
-            ToTensor(),
-            Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711)),
-        ]
-    )
+@functools.lru_cache(maxsize=None)
+def _warn_if_stock_pillow() -> None:
+    # Pillow-SIMD releases carry a ".postN" suffix
+    if ".post" not in PIL.__version__:
+        logger.info("Decoding images with stock Pillow; installing Pillow-SIMD speeds up decoding and resizing")
+
+
+def read_image(path: str, device: Union[str, torch.device] = "cpu") -> torch.Tensor:
+    """Read an image into a uint8 (3, H, W) tensor that can be fed to the preprocess module returned by `load()`
+
+    JPEG images are decoded on the GPU with nvJPEG when `device` is a CUDA device. Other images are decoded by
+    `torchvision.io` without going through PIL, which is only used for formats torchvision cannot decode.
+    """
+    device = torch.device(device)
+    data = read_file(path)
+
+    if device.type == "cuda" and data[:3].tolist() == [0xFF, 0xD8, 0xFF]:
+        return decode_jpeg(data, mode=ImageReadMode.RGB, device=device)
+
+    try:
+        return decode_image(data, mode=ImageReadMode.RGB).to(device)
+    except RuntimeError:
+        _warn_if_stock_pillow()
+        with Image.open(path) as image:
+            return pil_to_tensor(_convert_image_to_rgb(image)).to(device)
+
+
+class _FusedPreprocess(nn.Module):
+    """CLIP image preprocessing fused into a single batched tensor pipeline.
+
+    Equivalent (up to resampling at the crop border) to
+    ``Resize(n_px, BICUBIC) -> CenterCrop(n_px) -> ToTensor() -> Normalize(mean, std)``, but the
+    crop, resize, rescaling and normalization are traced into one kernel by ``torch.compile`` instead of making a
+    separate pass over the image for each step. The module operates on whole ``(B, 3, H, W)`` uint8 batches, so
+    it can run on the same device as the CLIP model.
+
+    Args:
+        n_px (int): Output resolution of the (square) image.
+    """
+
+    def __init__(self, n_px: int):
+        super().__init__()
+        self.n_px = n_px
+        mean = torch.tensor((0.48145466, 0.4578275, 0.40821073)).view(3, 1, 1)
+        std = torch.tensor((0.26862954, 0.26130258, 0.27577711)).view(3, 1, 1)
+        # (x / 255 - mean) / std == (x - 255 * mean) * (1 / (255 * std)), so normalization is one sub_ and one mul_
+        self.register_buffer("shifted_mean", mean * 255, persistent=False)
+        self.register_buffer("scale", 1 / (std * 255), persistent=False)
+
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        # Resize(n_px) followed by CenterCrop(n_px) keeps only the centered square of the image, so crop that square
+        # first and resize it directly to n_px; the discarded band is never converted or resampled
+        height, width = images.shape[-2:]
+        side = min(height, width)
+        top, left = (height - side) // 2, (width - side) // 2
+        x = images[..., top : top + side, left : left + side].to(device=self.scale.device, dtype=self.scale.dtype)
+        x = F.interpolate(x, size=(self.n_px, self.n_px), mode="bicubic", align_corners=False, antialias=True)
+
+        return x.clamp_(0, 255).sub_(self.shifted_mean).mul_(self.scale)
+
+
+class _Preprocess(nn.Module):
+    """Adapter that feeds single images or batches into the compiled preprocessing module.
+
+    Accepts a ``(B, 3, H, W)`` uint8 batch, a single ``(3, H, W)`` uint8 image or a PIL image. Single images are
+    returned as ``(3, n_px, n_px)`` tensors for backward compatibility with the original PIL-based transform.
+
+    Args:
+        n_px (int): Output resolution of the (square) image.
+    """
+
+    def __init__(self, n_px: int):
+        super().__init__()
+        self.fused = _FusedPreprocess(n_px)
+        # compiled on the first call, so that building a CLIP model never depends on Dynamo being supported
+        self.compiled = None
+
+    def _preprocess(self, images: torch.Tensor) -> torch.Tensor:
+        if self.compiled is None:
+            try:
+                self.compiled = torch.compile(self.fused)
+            except Exception as exception:  # Dynamo is not supported on every Python version and platform
+                logger.warning("torch.compile is unavailable, CLIP preprocessing runs eagerly: %s", exception)
+                self.compiled = self.fused
+
+        if self.compiled is self.fused:
+            return self.fused(images)
+
+        try:
+            return self.compiled(images)
+        except Exception as exception:  # compilation happens on the first call, e.g. inductor needs a C++ toolchain
+            output = self.fused(images)
+            logger.warning("torch.compile failed, CLIP preprocessing runs eagerly: %s", exception)
+            self.compiled = self.fused
+            return output
+
+    def forward(self, images: Union[torch.Tensor, Image.Image]) -> torch.Tensor:
+        if isinstance(images, Image.Image):
+            images = pil_to_tensor(_convert_image_to_rgb(images))
+        if images.dim() == 3:
+            return self._preprocess(images.unsqueeze(0)).squeeze(0)
+        return self._preprocess(images)
+
+
+@functools.lru_cache(maxsize=8)
+def _transform(n_px, device):
+    # cached so that repeated load() calls reuse the already compiled module; it holds no state that changes
+    # during inference, so sharing it is safe
+    return _Preprocess(n_px).to(device)
+
+
+@functools.lru_cache(maxsize=None)
+def _log_jit_is_noop() -> None:
+    logger.info("jit=True is now a no-op; model rebuilt from state_dict")
 
 
 def available_models() -> List[str]:
@@ -135,7 +376,8 @@ def load(
             The device to put the loaded model
 
         jit : bool
-            Whether to load the optimized JIT model or more hackable non-JIT model (default).
+            Kept for backward compatibility; has no effect. The model is always rebuilt from the checkpoint's
+            state_dict, so JIT archives load as the non-JIT model.
 
         download_root: str
             path to download the model files; by default, it uses "~/.cache/clip"
@@ -144,8 +386,10 @@ def load(
         model : torch.nn.Module
             The CLIP model
 
-        preprocess : Callable[[PIL.Image], torch.Tensor]
-            A torchvision transform that converts a PIL image into a tensor that the returned model can take as its input
+        preprocess : Callable[[Union[PIL.Image, torch.Tensor]], torch.Tensor]
+            A module, placed on `device`, that converts a (B, 3, H, W) uint8 batch (e.g. from
+            `clip.read_image`) into a tensor that the returned model can take as its input.
+            A single PIL image or (3, H, W) tensor is also accepted and returns a (3, H, W) tensor
     """
     if name in _MODELS:
         model_path = _download(_MODELS[name], download_root or os.path.expanduser("~/.cache/clip"))
@@ -154,73 +398,30 @@ def load(
     else:
         raise RuntimeError(f"Model {name} not found; available models = {available_models()}")
 
+    if jit:
+        _log_jit_is_noop()
+
     with open(model_path, "rb") as opened_file:
-        try:
-            # loading JIT archive
-            model = torch.jit.load(opened_file, map_location=device if jit else "cpu").eval()
-            state_dict = None
-        except RuntimeError:
+        # pick the loader from the zip central directory (a few KB) instead of attempting torch.jit.load first;
+        # TorchScript archives carry a code/ directory, torch.save checkpoints and legacy pickles do not
+        is_zip = zipfile.is_zipfile(opened_file)
+        is_jit_archive = False
+        if is_zip:
+            with zipfile.ZipFile(opened_file) as archive:
+                is_jit_archive = any("/code/__torch__/" in entry for entry in archive.namelist())
+        opened_file.seek(0)
+
+        if is_jit_archive:
+            # loading JIT archive, only to extract its state dict
+            state_dict = torch.jit.load(opened_file, map_location="cpu").state_dict()
+        else:
             # loading saved state dict
-            if jit:
-                msg = f"File {model_path} is not a JIT archive. Loading as a state dict instead"
-                logger.warn(msg)
-                jit = False
-            state_dict = torch.load(opened_file, map_location="cpu")
-
-    if not jit:
-        model = build_model(state_dict or model.state_dict()).to(device)
-        if str(device) == "cpu":
-            model.float()
-        return model, _transform(model.visual.input_resolution)
-
-    # patch the device names
-    device_holder = torch.jit.trace(lambda: torch.ones([]).to(torch.device(device)), example_inputs=[])
-    device_node = [n for n in device_holder.graph.findAllNodes("prim::Constant") if "Device" in repr(n)][-1]
-
-    def patch_device(module):
-        try:
-            graphs = [module.graph] if hasattr(module, "graph") else []
-        except RuntimeError:
-            graphs = []
-
-        if hasattr(module, "forward1"):
-            graphs.append(module.forward1.graph)
+            # memory-map the storages of zip checkpoints instead of copying them into process memory;
+            # build_model copies the tensors into its own parameters, so the mapping is released afterwards
+            load_kwargs = {"mmap": True} if is_zip and _TORCH_SUPPORTS_MMAP else {}
+            state_dict = torch.load(model_path, map_location="cpu", weights_only=True, **load_kwargs)
 
-        for graph in graphs:
-            for node in graph.findAllNodes("prim::Constant"):
-                if "value" in node.attributeNames() and str(node["value"]).startswith("cuda"):
-                    node.copyAttributes(device_node)
-
-    model.apply(patch_device)
-    patch_device(model.encode_image)
-    patch_device(model.encode_text)
-
-    # patch dtype to float32 on CPU
+    model = build_model(state_dict).to(device)
     if str(device) == "cpu":
-        float_holder = torch.jit.trace(lambda: torch.ones([]).float(), example_inputs=[])
-        float_input = list(float_holder.graph.findNode("aten::to").inputs())[1]
-        float_node = float_input.node()
-
-        def patch_float(module):
-            try:
-                graphs = [module.graph] if hasattr(module, "graph") else []
-            except RuntimeError:
-                graphs = []
-
-            if hasattr(module, "forward1"):
-                graphs.append(module.forward1.graph)
-
-            for graph in graphs:
-                for node in graph.findAllNodes("aten::to"):
-                    inputs = list(node.inputs())
-                    for i in [1, 2]:  # dtype can be the second or third argument to aten::to()
-                        if inputs[i].node()["value"] == 5:
-                            inputs[i].node().copyAttributes(float_node)
-
-        model.apply(patch_float)
-        patch_float(model.encode_image)
-        patch_float(model.encode_text)
-
         model.float()
-
-    return model, _transform(model.input_resolution.item())
+    return model, _transform(model.visual.input_resolution, torch.device(device))
@@ -0,0 +1,50 @@
+"""Tests for the install subcommand."""
+
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from packaging.requirements import Requirement
+from pytest_mock import MockerFixture
+
+from anomalib.cli.install import anomalib_install
+
+
+@pytest.fixture()
+def pip_install(mocker: MockerFixture) -> object:
+    """Mock the pip install command and the anomalib requirements."""
+    mocker.patch(
+        "anomalib.cli.install._anomalib_requirements",
+        return_value={"openvino": [Requirement("openvino>=2024.0")]},
+    )
+    pip_install_cmd = mocker.patch("anomalib.cli.install._pip_install_cmd")
+    pip_install_cmd.return_value.main.return_value = 0
+    return pip_install_cmd.return_value
+
+
+def test_anomalib_install_skips_satisfied_requirements(mocker: MockerFixture, pip_install: object) -> None:
+    """Test that pip is not run when all requirements are already satisfied."""
+    mocker.patch("anomalib.cli.utils.installation.get_missing_requirements", return_value=[])
+    assert anomalib_install(option="openvino") == 0
+    pip_install.main.assert_not_called()
+
+
+def test_anomalib_install_missing_requirements(mocker: MockerFixture, pip_install: object) -> None:
+    """Test that pip only installs the missing requirements."""
+    mocker.patch(
+        "anomalib.cli.utils.installation.get_missing_requirements",
+        return_value=["openvino>=2024.0"],
+    )
+    assert anomalib_install(option="openvino") == 0
+    pip_install.main.assert_called_once_with(["openvino>=2024.0"])
+
+
+def test_anomalib_install_force(mocker: MockerFixture, pip_install: object) -> None:
+    """Test that ``force`` runs pip even if all requirements are satisfied."""
+    get_missing_requirements = mocker.patch(
+        "anomalib.cli.utils.installation.get_missing_requirements",
+        return_value=[],
+    )
+    assert anomalib_install(option="openvino", force=True) == 0
+    get_missing_requirements.assert_not_called()
+    pip_install.main.assert_called_once_with(["openvino>=2024.0"])
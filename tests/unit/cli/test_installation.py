@@ -5,10 +5,11 @@
 
 import os
 import tempfile
+from importlib.metadata import PackageNotFoundError
 from pathlib import Path
 
 import pytest
-from pkg_resources import Requirement
+from packaging.requirements import Requirement
 from pytest_mock import MockerFixture
 
 from anomalib.cli.utils.installation import (
@@ -16,6 +17,7 @@ from anomalib.cli.utils.installation import (
     get_cuda_suffix,
     get_cuda_version,
     get_hardware_suffix,
+    get_missing_requirements,
     get_requirements,
     get_torch_install_args,
     parse_requirements,
@@ -48,8 +50,8 @@ def test_get_requirements(mocker: MockerFixture) -> None:
 def test_parse_requirements() -> None:
     """Test that parse_requirements returns the expected tuple of requirements."""
     requirements = [
-        Requirement.parse("torch==2.0.0"),
-        Requirement.parse("onnx>=1.8.1"),
+        Requirement("torch==2.0.0"),
+        Requirement("onnx>=1.8.1"),
     ]
     torch_req, other_reqs = parse_requirements(requirements)
     assert isinstance(torch_req, str)
@@ -58,19 +60,50 @@ def test_parse_requirements() -> None:
     assert other_reqs == ["onnx>=1.8.1"]
 
     requirements = [
-        Requirement.parse("torch<=2.0.1, >=1.8.1"),
+        Requirement("torch<=2.0.1, >=1.8.1"),
     ]
     torch_req, other_reqs = parse_requirements(requirements)
     assert torch_req == "torch<=2.0.1,>=1.8.1"
     assert other_reqs == []
 
     requirements = [
-        Requirement.parse("onnx>=1.8.1"),
+        Requirement("onnx>=1.8.1"),
     ]
     with pytest.raises(ValueError, match="Could not find torch requirement."):
         parse_requirements(requirements)
 
 
+def test_get_missing_requirements(mocker: MockerFixture) -> None:
+    """Test that get_missing_requirements drops the requirements that are already installed."""
+    installed = {"onnx": "1.16.0", "torch": "2.1.1"}
+
+    def mock_version(name: str) -> str:
+        if name not in installed:
+            raise PackageNotFoundError(name)
+        return installed[name]
+
+    mocker.patch("anomalib.cli.utils.installation.get_installed_version", side_effect=mock_version)
+
+    assert get_missing_requirements(["onnx>=1.8.1"]) == []
+    assert get_missing_requirements(["onnx>=1.8.1", "openvino>=2024.0"]) == ["openvino>=2024.0"]
+    assert get_missing_requirements(["onnx>=1.17.0"]) == ["onnx>=1.17.0"]
+
+    install_args = ["--extra-index-url", "https://download.pytorch.org/whl/cpu", "torch==2.1.1", "torchvision==0.16.1"]
+    assert get_missing_requirements(install_args) == [
+        "torchvision==0.16.1",
+        "--extra-index-url",
+        "https://download.pytorch.org/whl/cpu",
+    ]
+    assert get_missing_requirements(install_args[:3]) == []
+
+    # Extras are not checked, so requirements with extras are always installed.
+    assert get_missing_requirements(["onnx[reference]>=1.8.1"]) == ["onnx[reference]>=1.8.1"]
+
+    # Flags without a value must not swallow the next requirement.
+    assert get_missing_requirements(["--upgrade", "openvino>=2024.0"]) == ["openvino>=2024.0", "--upgrade"]
+    assert get_missing_requirements(["openvino>=2024.0", "--index-url"]) == ["openvino>=2024.0", "--index-url"]
+
+
 def test_get_cuda_version_with_version_file(mocker: MockerFixture, tmp_path: Path) -> None:
     """Test that get_cuda_version returns the expected CUDA version when version file exists."""
     tmp_path = tmp_path / "cuda"
@@ -125,29 +158,29 @@ def test_get_hardware_suffix(mocker: MockerFixture) -> None:
 def test_add_hardware_suffix_to_torch(mocker: MockerFixture) -> None:
     """Test that add_hardware_suffix_to_torch returns the expected updated requirement."""
     mocker.patch("anomalib.cli.utils.installation.get_hardware_suffix", return_value="cu121")
-    requirement = Requirement.parse("torch>=1.13.0, <=2.0.1")
+    requirement = Requirement("torch>=1.13.0, <=2.0.1")
     updated_requirement = add_hardware_suffix_to_torch(requirement)
     assert "torch" in updated_requirement
     assert ">=1.13.0+cu121" in updated_requirement
     assert "<=2.0.1+cu121" in updated_requirement
 
-    requirement = Requirement.parse("torch==2.0.1")
+    requirement = Requirement("torch==2.0.1")
     mocker.patch("anomalib.cli.utils.installation.get_hardware_suffix", return_value="cu118")
     updated_requirement = add_hardware_suffix_to_torch(requirement, with_available_torch_build=True)
     assert updated_requirement == "torch==2.0.1+cu118"
 
-    requirement = Requirement.parse("torch==2.0.1")
+    requirement = Requirement("torch==2.0.1")
     updated_requirement = add_hardware_suffix_to_torch(requirement, hardware_suffix="cu111")
     assert updated_requirement == "torch==2.0.1+cu111"
 
-    requirement = Requirement.parse("torch>=1.13.0, <=2.0.1, !=1.14.0")
+    requirement = Requirement("torch>=1.13.0, <=2.0.1, !=1.14.0")
     with pytest.raises(ValueError, match="Requirement version can be a single value or a range."):
         add_hardware_suffix_to_torch(requirement)
 
 
 def test_get_torch_install_args(mocker: MockerFixture) -> None:
     """Test that get_torch_install_args returns the expected install arguments."""
-    requirement = Requirement.parse("torch>=2.1.1")
+    requirement = Requirement("torch>=2.1.1")
     mocker.patch("anomalib.cli.utils.installation.platform.system", return_value="Linux")
     mocker.patch("anomalib.cli.utils.installation.get_hardware_suffix", return_value="cpu")
     install_args = get_torch_install_args(requirement)
@@ -160,17 +193,29 @@ def test_get_torch_install_args(mocker: MockerFixture) -> None:
     for arg in expected_args:
         assert arg in install_args
 
-    requirement = Requirement.parse("torch>=1.13.0,<=2.0.1")
+    requirement = Requirement("torch>=1.13.0,<=2.0.1")
     mocker.patch("anomalib.cli.utils.installation.get_hardware_suffix", return_value="cu111")
     install_args = get_torch_install_args(requirement)
+    # 2.0.1 is the only written version that is an available build within the range.
     expected_args = [
         "--extra-index-url",
         "https://download.pytorch.org/whl/cu111",
+        "torchvision<=0.15.2+cu111",
     ]
     for arg in expected_args:
         assert arg in install_args
 
-    requirement = Requirement.parse("torch==2.0.1")
+    # The selection does not depend on the order of the specifiers.
+    requirement = Requirement("torch<=2.0.1,>=1.8.1")
+    install_args = get_torch_install_args(requirement)
+    assert "torchvision<=0.15.2+cu111" in install_args
+
+    # Without an available written version, the latest available build within the range is pinned.
+    requirement = Requirement("torch>=1.8.1,<2.1")
+    install_args = get_torch_install_args(requirement)
+    assert "torchvision==0.15.2+cu111" in install_args
+
+    requirement = Requirement("torch==2.0.1")
     expected_args = [
         "--extra-index-url",
         "https://download.pytorch.org/whl/cu111",
@@ -185,7 +230,7 @@ def test_get_torch_install_args(mocker: MockerFixture) -> None:
     assert install_args == ["torch"]
 
     mocker.patch("anomalib.cli.utils.installation.platform.system", return_value="Darwin")
-    requirement = Requirement.parse("torch==2.0.1")
+    requirement = Requirement("torch==2.0.1")
     install_args = get_torch_install_args(requirement)
     assert install_args == ["torch==2.0.1"]
 
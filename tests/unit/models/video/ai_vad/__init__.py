@@ -0,0 +1,4 @@
+"""Unit tests for AI-VAD video anomaly detection model."""
+
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
@@ -0,0 +1,315 @@
+"""Unit tests for the CLIP helpers of the AI-VAD model."""
+
+# Copyright (C) 2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+import torch
+from PIL import Image
+from pytest_mock import MockerFixture
+from torchvision.transforms import v2
+
+from anomalib.models.video.ai_vad.clip import clip
+
+DATA = bytes(range(256)) * 64
+SHA256 = hashlib.sha256(DATA).hexdigest()
+URL = f"https://openaipublic.azureedge.net/clip/models/{SHA256}/ViT-B-16.pt"
+
+
+def _response(status_code: int, content: bytes = b"") -> MagicMock:
+    """Create a mocked streaming response."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = {"Content-Length": str(len(content))}
+    response.iter_content.return_value = [content]
+    return response
+
+
+class TestPreprocess:
+    """Test the preprocessing module returned by ``clip.load``."""
+
+    def test_compile_is_deferred(self, mocker: MockerFixture) -> None:
+        """Creating the module must not call torch.compile."""
+        compile_mock = mocker.patch("anomalib.models.video.ai_vad.clip.clip.torch.compile")
+        clip._Preprocess(224)  # noqa: SLF001
+        compile_mock.assert_not_called()
+
+    def test_eager_fallback(self, mocker: MockerFixture) -> None:
+        """Preprocessing still works when torch.compile is unavailable."""
+        mocker.patch(
+            "anomalib.models.video.ai_vad.clip.clip.torch.compile",
+            side_effect=RuntimeError("Dynamo is not supported"),
+        )
+        preprocess = clip._Preprocess(224)  # noqa: SLF001
+
+        images = torch.randint(0, 256, (2, 3, 240, 320), dtype=torch.uint8)
+        assert preprocess(images).shape == (2, 3, 224, 224)
+        assert preprocess(images[0]).shape == (3, 224, 224)
+
+    @pytest.mark.parametrize(("height", "width", "atol"), [(256, 256, 0.02), (240, 320, 0.1), (320, 240, 0.1)])
+    def test_matches_reference_pipeline(self, height: int, width: int, atol: float) -> None:
+        """The fused module matches Resize -> CenterCrop -> ToDtype -> Normalize.
+
+        Cropping before resizing shifts the sampling grid of non-square images by less than a pixel, so a smooth
+        image is used and the tolerance is larger for those.
+        """
+        y, x = torch.meshgrid(torch.arange(height), torch.arange(width), indexing="ij")
+        image = torch.stack(
+            [
+                127.5 + 127.5 * torch.sin(x / 40),
+                127.5 + 127.5 * torch.cos(y / 50),
+                127.5 + 127.5 * torch.sin((x + y) / 60),
+            ],
+        )
+        images = image.round().to(torch.uint8).unsqueeze(0)
+
+        reference = v2.Compose(
+            [
+                v2.Resize(224, interpolation=v2.InterpolationMode.BICUBIC, antialias=True),
+                v2.CenterCrop(224),
+                v2.ToDtype(torch.float32, scale=True),
+                v2.Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711)),
+            ],
+        )
+
+        output = clip._FusedPreprocess(224)(images)  # noqa: SLF001
+        assert torch.allclose(output, reference(images), atol=atol)
+
+    def test_clamp(self) -> None:
+        """Bicubic overshoot is clamped to the value range of the input before normalization."""
+        images = torch.zeros(1, 3, 224, 224, dtype=torch.uint8)
+        images[..., ::2, :] = 255
+
+        output = clip._FusedPreprocess(224)(images)  # noqa: SLF001
+
+        mean = torch.tensor((0.48145466, 0.4578275, 0.40821073)).view(3, 1, 1)
+        std = torch.tensor((0.26862954, 0.26130258, 0.27577711)).view(3, 1, 1)
+        assert torch.all(output >= (0 - mean) / std - 1e-5)
+        assert torch.all(output <= (1 - mean) / std + 1e-5)
+
+
+class TestReadImage:
+    """Test decoding images for the preprocessing module."""
+
+    @pytest.fixture()
+    def image_paths(self, tmp_path: Path) -> dict[str, Path]:
+        """Write a small PNG and JPEG image."""
+        image = Image.new("RGB", (32, 24), color=(255, 128, 0))
+        paths = {"png": tmp_path / "image.png", "jpeg": tmp_path / "image.jpg"}
+        image.save(paths["png"])
+        image.save(paths["jpeg"])
+        return paths
+
+    @pytest.mark.parametrize("image_format", ["png", "jpeg"])
+    def test_decode(self, image_paths: dict[str, Path], image_format: str) -> None:
+        """Images are decoded to (3, H, W) uint8 tensors."""
+        image = clip.read_image(str(image_paths[image_format]))
+        assert image.shape == (3, 24, 32)
+        assert image.dtype == torch.uint8
+
+    def test_jpeg_on_cuda(self, mocker: MockerFixture, image_paths: dict[str, Path]) -> None:
+        """Only JPEG images are decoded with nvJPEG on CUDA devices."""
+        decode_jpeg = mocker.patch(
+            "anomalib.models.video.ai_vad.clip.clip.decode_jpeg",
+            return_value=torch.zeros(3, 24, 32, dtype=torch.uint8),
+        )
+        mocker.patch("anomalib.models.video.ai_vad.clip.clip.decode_image", return_value=MagicMock())
+
+        clip.read_image(str(image_paths["jpeg"]), device="cuda")
+        decode_jpeg.assert_called_once()
+        assert decode_jpeg.call_args.kwargs["device"] == torch.device("cuda")
+
+        clip.read_image(str(image_paths["png"]), device="cuda")
+        decode_jpeg.assert_called_once()
+
+    def test_pil_fallback(self, mocker: MockerFixture, image_paths: dict[str, Path]) -> None:
+        """PIL is used for images torchvision cannot decode."""
+        mocker.patch(
+            "anomalib.models.video.ai_vad.clip.clip.decode_image",
+            side_effect=RuntimeError("unsupported image"),
+        )
+        warn_if_stock_pillow = mocker.patch("anomalib.models.video.ai_vad.clip.clip._warn_if_stock_pillow")
+
+        image = clip.read_image(str(image_paths["png"]))
+
+        warn_if_stock_pillow.assert_called_once()
+        assert image.shape == (3, 24, 32)
+        assert image.dtype == torch.uint8
+        assert image[:, 0, 0].tolist() == [255, 128, 0]
+
+
+class TestHashFile:
+    """Test hashing CLIP checkpoints."""
+
+    def test_hash_file(self, tmp_path: Path) -> None:
+        """The pipelined hash matches a plain SHA-256 of the file."""
+        file_path = tmp_path / "weights.pt"
+        file_path.write_bytes(DATA)
+        assert clip._hash_file(str(file_path), chunk_size=1000).hexdigest() == SHA256  # noqa: SLF001
+
+    def test_reader_error(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """Errors in the reader thread are raised in the caller instead of blocking it."""
+        file_path = tmp_path / "weights.pt"
+        file_path.write_bytes(DATA)
+        mocker.patch("anomalib.models.video.ai_vad.clip.clip.iter", side_effect=MemoryError, create=True)
+        with pytest.raises(MemoryError):
+            clip._hash_file(str(file_path))  # noqa: SLF001
+
+    def test_consumer_error(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """The reader thread stops when hashing fails, instead of blocking on the full queue."""
+        file_path = tmp_path / "weights.pt"
+        file_path.write_bytes(DATA)
+        sha256_hash = MagicMock()
+        sha256_hash.update.side_effect = ValueError("hashing failed")
+        mocker.patch.object(clip, "_sha256", return_value=sha256_hash)
+
+        with pytest.raises(ValueError, match="hashing failed"):
+            clip._hash_file(str(file_path), chunk_size=100)  # noqa: SLF001
+
+        assert not any(thread.name == "clip-hash-reader" for thread in threading.enumerate())
+
+
+class TestDownload:
+    """Test downloading and resuming CLIP checkpoints."""
+
+    def test_download(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A fresh download is written to the checksum-named file."""
+        get = mocker.patch.object(clip._SESSION, "get", return_value=_response(200, DATA))  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert Path(target) == tmp_path / f"{SHA256}.pt"
+        assert Path(target).read_bytes() == DATA
+        assert not (tmp_path / f"{SHA256}.pt.part").exists()
+        assert get.call_args.kwargs["headers"] == {}
+
+    def test_resume(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A partial download is resumed with a Range request."""
+        (tmp_path / f"{SHA256}.pt.part").write_bytes(DATA[:100])
+        get = mocker.patch.object(clip._SESSION, "get", return_value=_response(206, DATA[100:]))  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert get.call_args.kwargs["headers"] == {"Range": "bytes=100-"}
+        assert Path(target).read_bytes() == DATA
+        assert not (tmp_path / f"{SHA256}.pt.part").exists()
+
+    def test_complete_partial(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A complete partial file is moved into place without a new request."""
+        (tmp_path / f"{SHA256}.pt.part").write_bytes(DATA)
+        get = mocker.patch.object(clip._SESSION, "get")  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        get.assert_not_called()
+        assert Path(target).read_bytes() == DATA
+        assert not (tmp_path / f"{SHA256}.pt.part").exists()
+
+    def test_prefix_hashed_before_request(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """The partial file is hashed before the ranged request is sent."""
+        (tmp_path / f"{SHA256}.pt.part").write_bytes(DATA[:100])
+        calls = []
+        hash_file = clip._hash_file  # noqa: SLF001
+        mocker.patch.object(
+            clip,
+            "_hash_file",
+            side_effect=lambda *args, **kwargs: calls.append("hash") or hash_file(*args, **kwargs),
+        )
+        mocker.patch.object(
+            clip._SESSION,  # noqa: SLF001
+            "get",
+            side_effect=lambda *args, **kwargs: calls.append("get") or _response(206, DATA[100:]),
+        )
+
+        clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert calls == ["hash", "get"]
+
+    def test_range_not_supported(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """The partial file is rewritten when the server ignores the Range header."""
+        (tmp_path / f"{SHA256}.pt.part").write_bytes(b"stale")
+        mocker.patch.object(clip._SESSION, "get", return_value=_response(200, DATA))  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert Path(target).read_bytes() == DATA
+
+    def test_range_not_satisfiable(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """The download restarts when the server rejects the Range header."""
+        (tmp_path / f"{SHA256}.pt.part").write_bytes(DATA + b"extra")
+        rejected = _response(416)
+        get = mocker.patch.object(
+            clip._SESSION,  # noqa: SLF001
+            "get",
+            side_effect=[rejected, _response(200, DATA)],
+        )
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        rejected.close.assert_called_once()
+        assert get.call_count == 2
+        assert Path(target).read_bytes() == DATA
+
+    def test_resume_checksum_mismatch(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A resumed download that fails the checksum removes the partial file."""
+        partial = tmp_path / f"{SHA256}.pt.part"
+        partial.write_bytes(b"\x00" * 100)
+        mocker.patch.object(clip._SESSION, "get", return_value=_response(206, DATA[100:]))  # noqa: SLF001
+
+        with pytest.raises(RuntimeError, match="checksum does not match"):
+            clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert not partial.exists()
+        assert not (tmp_path / f"{SHA256}.pt").exists()
+
+
+class TestCache:
+    """Test the checksum-addressed cache of CLIP checkpoints."""
+
+    def test_verified_marker(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A file with a matching marker is not hashed again."""
+        mocker.patch.object(clip._SESSION, "get", return_value=_response(200, DATA))  # noqa: SLF001
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+        assert (tmp_path / f"{SHA256}.ok").is_file()
+
+        verify_checksum = mocker.spy(clip, "_verify_checksum")
+        assert clip._download(URL, str(tmp_path)) == target  # noqa: SLF001
+        verify_checksum.assert_not_called()
+
+    def test_stale_marker(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """The file is verified again once its stat no longer matches the marker."""
+        mocker.patch.object(clip._SESSION, "get", return_value=_response(200, DATA))  # noqa: SLF001
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+        (tmp_path / f"{SHA256}.ok").write_text("0 0")
+
+        verify_checksum = mocker.spy(clip, "_verify_checksum")
+        assert clip._download(URL, str(tmp_path)) == target  # noqa: SLF001
+        verify_checksum.assert_called_once()
+        assert (tmp_path / f"{SHA256}.ok").read_text() != "0 0"
+
+    def test_legacy_cache(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A file cached under the url basename is moved to the checksum name instead of downloaded."""
+        (tmp_path / "ViT-B-16.pt").write_bytes(DATA)
+        get = mocker.patch.object(clip._SESSION, "get")  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        get.assert_not_called()
+        assert Path(target) == tmp_path / f"{SHA256}.pt"
+        assert Path(target).read_bytes() == DATA
+        assert not (tmp_path / "ViT-B-16.pt").exists()
+
+    def test_corrupt_legacy_cache(self, mocker: MockerFixture, tmp_path: Path) -> None:
+        """A corrupt file under the url basename is removed and the checkpoint downloaded."""
+        (tmp_path / "ViT-B-16.pt").write_bytes(b"corrupt")
+        mocker.patch.object(clip._SESSION, "get", return_value=_response(200, DATA))  # noqa: SLF001
+
+        target = clip._download(URL, str(tmp_path))  # noqa: SLF001
+
+        assert Path(target).read_bytes() == DATA
+        assert not (tmp_path / "ViT-B-16.pt").exists()